@@ -0,0 +1,10 @@
+"""dashboard 與 daily_recorder 共用的民國曆 / 代號清洗核心"""
+import re
+
+# 民國年與西元年的差
+ROC_OFFSET = 1911
+
+# 處置內容裡的民國迄日，如「…至114年1月20日…」；預先編譯避免每列查表
+TW_DATE_RE = re.compile(r'至(\d{3})年(\d{1,2})月(\d{1,2})日')
+# 代號欄清洗：去掉所有非數字字元
+NON_DIGIT_RE = re.compile(r'\D+')
@@ -1,60 +1,108 @@
+import hashlib
+import json
 import requests
 import pandas as pd
 import os
 import urllib3
-import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from lxml import html as lxml_html
+from requests.adapters import HTTPAdapter
+
+from core import ROC_OFFSET, TW_DATE_RE, NON_DIGIT_RE
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 DB_FILE = "history_db.csv"
 JAIL_FILE = "jail_list.csv"
+HTTP_CACHE_DIR = ".http_cache"
+
+# 共用連線池：keep-alive 免去每次 GET 重新 TLS 握手
+_SESSION = requests.Session()
+_SESSION.headers.update({'User-Agent': 'Mozilla/5.0', 'Accept-Encoding': 'gzip, deflate'})
+_SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=10))
+
+def conditional_get(url):
+    """帶 ETag/Last-Modified 驗證的 GET：內容沒變時伺服器回 304，直接沿用本地快取的頁面"""
+    key = hashlib.md5(url.encode()).hexdigest()
+    meta_path = os.path.join(HTTP_CACHE_DIR, key + ".json")
+    body_path = os.path.join(HTTP_CACHE_DIR, key + ".html")
+    headers = {}
+    if os.path.exists(meta_path) and os.path.exists(body_path):
+        with open(meta_path) as fh:
+            meta = json.load(fh)
+        if meta.get('etag'): headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'): headers['If-Modified-Since'] = meta['last_modified']
+    r = _SESSION.get(url, headers=headers, verify=False)
+    if r.status_code == 304:
+        with open(body_path, 'rb') as fh:
+            return fh.read()
+    r.raise_for_status()
+    os.makedirs(HTTP_CACHE_DIR, exist_ok=True)
+    with open(body_path, 'wb') as fh:
+        fh.write(r.content)
+    with open(meta_path, 'w') as fh:
+        json.dump({'etag': r.headers.get('ETag', ''),
+                   'last_modified': r.headers.get('Last-Modified', '')}, fh)
+    return r.content
+
+def fetch_attention_rows(today_str):
+    """抓取注意股清單"""
+    # 與處置頁同一套低層路徑：bytes 直接餵給 lxml，不經過 read_html 建表
+    tree = lxml_html.fromstring(conditional_get("https://www.ibfs.com.tw/stock3/default13-1.aspx?xy=8&xt=1"))
+    data = [[''.join(td.itertext()).strip() for td in tr]
+            for tr in tree.xpath("//table[contains(., '注意交易資訊')]//tr[count(td) >= 2]")]
+    if not data:
+        return pd.DataFrame(columns=["日期", "代號", "狀態"]), []
+    codes = pd.DataFrame(data)[1].astype(str).str.replace(NON_DIGIT_RE, '', regex=True)
+    codes = codes[codes != '']  # 表頭與版面列抽不出代號，直接剔除
+    return pd.DataFrame({"日期": today_str, "代號": codes, "狀態": "注意股"}), []
 
-def parse_disposal_date(content):
-    try:
-        match = re.search(r'至(\d{3})年(\d{1,2})月(\d{1,2})日', str(content))
-        if match:
-            year = int(match.group(1)) + 1911
-            return datetime(year, int(match.group(2)), int(match.group(3)))
-    except: pass
-    return None
+def fetch_disposal_rows(today_str, now):
+    """抓取處置股清單，並回傳需加入監控的代號"""
+    # 用 XPath 直接鎖定處置表的資料列，跳過 read_html 對整頁每張表建 DataFrame
+    tree = lxml_html.fromstring(conditional_get("https://www.ibfs.com.tw/stock3/measuringstock.aspx?xy=6&xt=1"))
+    # 直接走訪子節點一次取完整列文字，省掉每格再跑一次 XPath
+    data = [[''.join(td.itertext()).strip() for td in tr]
+            for tr in tree.xpath("//table[contains(., '處置內容')]//tr[count(td) >= 6]")]
+    if not data:
+        return pd.DataFrame(columns=["日期", "代號", "狀態"]), []
+    raw = pd.DataFrame(data)
+    codes = raw[1].astype(str).str.replace(NON_DIGIT_RE, '', regex=True)
+    # 表頭與版面列抽不出代號，直接剔除 (ibfs 表頭也是 td，XPath 會一併抓到)
+    keep = codes != ''
+    raw, codes = raw[keep], codes[keep]
+    rows_df = pd.DataFrame({"日期": today_str, "代號": codes, "狀態": "處置股"})
+    # 自動識別是否需要加入監控清單：迄日尚未到期者 (NaT 比較自然為 False)
+    # 同一支編譯好的民國日期 regex，整欄 str.extract 一次抽完，不再逐列搜尋
+    ext = raw[5].astype(str).str.extract(TW_DATE_RE)
+    end_dts = pd.to_datetime({'year': ext[0].astype(float) + ROC_OFFSET,
+                              'month': ext[1].astype(float),
+                              'day': ext[2].astype(float)}, errors='coerce')
+    jail_codes = codes[(end_dts >= now).values].tolist()
+    return rows_df, jail_codes
 
 def update_data():
-    today_str = datetime.now().strftime("%Y-%m-%d")
-    headers = {'User-Agent': 'Mozilla/5.0'}
-    all_data = []
+    now = datetime.now()
+    today_str = now.strftime("%Y-%m-%d")
+    frames = []
     new_jail_codes = []
 
-    # --- 1. 抓取注意與處置股 ---
-    try:
-        # 注意股
-        r = requests.get("https://www.ibfs.com.tw/stock3/default13-1.aspx?xy=8&xt=1", headers=headers, verify=False)
-        dfs = pd.read_html(r.text)
-        for df in dfs:
-            if '注意交易資訊' in str(df.columns):
-                for _, row in df.iterrows():
-                    code = ''.join(filter(str.isdigit, str(row.iloc[1])))
-                    all_data.append({"日期": today_str, "代號": code, "狀態": "注意股"})
-        
-        # 處置股
-        r = requests.get("https://www.ibfs.com.tw/stock3/measuringstock.aspx?xy=6&xt=1", headers=headers, verify=False)
-        dfs = pd.read_html(r.text)
-        for df in dfs:
-            if '處置內容' in str(df.columns):
-                for _, row in df.iterrows():
-                    code = ''.join(filter(str.isdigit, str(row.iloc[1])))
-                    content = row.iloc[5]
-                    all_data.append({"日期": today_str, "代號": code, "狀態": "處置股"})
-                    # 自動識別是否需要加入監控清單
-                    end_dt = parse_disposal_date(content)
-                    if end_dt and end_dt >= datetime.now():
-                        new_jail_codes.append(code)
-    except Exception as e:
-        print(f"抓取失敗: {e}")
+    # --- 1. 並行抓取注意與處置股 (I/O bound，兩來源同時等網路) ---
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        futures = [ex.submit(fetch_attention_rows, today_str),
+                   ex.submit(fetch_disposal_rows, today_str, now)]
+    for fut in futures:
+        try:
+            df_part, jail_codes = fut.result()
+            frames.append(df_part)
+            new_jail_codes.extend(jail_codes)
+        except Exception as e:
+            print(f"抓取失敗: {e}")
 
     # --- 2. 更新 history_db.csv ---
-    if all_data:
-        new_df = pd.DataFrame(all_data)
+    if frames and sum(len(f) for f in frames):
+        new_df = pd.concat(frames, ignore_index=True)
         if os.path.exists(DB_FILE):
             old_df = pd.read_csv(DB_FILE, dtype=str)
             final_df = pd.concat([old_df[old_df["日期"] != today_str], new_df], ignore_index=True)
@@ -64,7 +112,8 @@ def update_data():
 
     # --- 3. 自動更新 jail_list.csv (新增與移除) ---
     if os.path.exists(JAIL_FILE):
-        jail_df = pd.read_csv(JAIL_FILE, dtype=str)
+        # 只解析會用到的 code 欄
+        jail_df = pd.read_csv(JAIL_FILE, dtype=str, usecols=['code'])
         existing_jail = jail_df['code'].tolist()
     else:
         existing_jail = []
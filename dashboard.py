@@ -1,11 +1,20 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import io
+import re
 from datetime import datetime, timedelta
 
+from core import ROC_OFFSET
+
+# 官方期間欄位，如「114/01/05~114/02/04」(分隔符也可能是 -)
+_PERIOD_RE = re.compile(r'(\d{1,3})/(\d{1,2})/(\d{1,2})[~-](\d{1,3})/(\d{1,2})/(\d{1,2})')
+
 # --- 1. 頁面配置 ---
 st.set_page_config(page_title="處置監控 (多選上傳版)", layout="wide", page_icon="⚖️")
 
+WEEKDAYS = ("一", "二", "三", "四", "五", "六", "日")
+
 # --- 2. 工具函式 ---
 def get_logical_today():
     """凌晨 6 點前視為前一交易日，適配半夜作業直覺"""
@@ -14,83 +23,78 @@ def get_logical_today():
         return (now - timedelta(days=1)).strftime("%Y-%m-%d")
     return now.strftime("%Y-%m-%d")
 
-def get_simple_date(date_str):
+def get_simple_date(d):
     """格式化為 12/24(三)"""
     try:
-        dt = datetime.strptime(str(date_str), "%Y-%m-%d")
-        weekdays = ["一", "二", "三", "四", "五", "六", "日"]
-        return f"{dt.month}/{dt.day}({weekdays[dt.weekday()]})"
-    except:
-        return str(date_str)
-
-def parse_period(period_str):
-    """將官方期間格式轉為西元日期 (起日, 出關日)"""
-    try:
-        clean_str = str(period_str).strip().replace(" ", "")
-        sep = '~' if '~' in clean_str else '-'
-        s_part, e_part = clean_str.split(sep)
-        def m_to_iso(s):
-            y, m, d = map(int, s.split('/'))
-            return datetime(y + 1911, m, d)
-        start_dt = m_to_iso(s_part)
-        release_dt = m_to_iso(e_part) + timedelta(days=1)
-        return start_dt.strftime("%Y-%m-%d"), release_dt.strftime("%Y-%m-%d")
-    except:
-        return None, None
-
-def translate_to_human(row):
-    """白話解讀標籤"""
-    reason = str(row.get('處置原因', ''))
-    mode = str(row.get('撮合方式', ''))
-    notes = []
-    if "沖銷" in reason: notes.append("🚫當沖加關")
-    if "20" in mode: notes.append("💀重刑犯(預收)")
-    return " / ".join(notes) if notes else "一般冷卻"
+        dt = pd.Timestamp(d)
+        return f"{dt.month}/{dt.day}({WEEKDAYS[dt.weekday()]})"
+    except (ValueError, TypeError):
+        return str(d)
+
+def translate_to_human(df):
+    """白話解讀標籤（整欄 np.select 一次算完，不跑逐列 apply）"""
+    day_trade = df['處置原因'].astype(str).str.contains('沖銷', regex=False)
+    heavy = df['撮合方式'].astype(str).str.contains('20', regex=False)
+    return np.select(
+        [day_trade & heavy, day_trade, heavy],
+        ["🚫當沖加關 / 💀重刑犯(預收)", "🚫當沖加關", "💀重刑犯(預收)"],
+        default="一般冷卻")
 
 # --- 3. 檔案解析引擎 ---
-def process_official_csv(uploaded_file):
-    """解析上市與上櫃 CSV，處理編碼與標頭"""
+@st.cache_data(show_spinner=False)
+def process_official_csv(raw_bytes):
+    """解析上市與上櫃 CSV，處理編碼與標頭（以檔案 bytes 為快取鍵，重按解析直接命中）"""
     results = []
-    logical_today = get_logical_today()
     try:
-        raw_bytes = uploaded_file.read()
         try: content = raw_bytes.decode('cp950') # 台灣官方 CSV 常用編碼
-        except: content = raw_bytes.decode('utf-8-sig')
+        except UnicodeDecodeError: content = raw_bytes.decode('utf-8-sig')
         lines = content.splitlines()
         if not lines: return []
 
+        # dtype=str：欄位全當字串處理，跳過型別推斷，代號也不會被推成 1234.0
         if "公布處置有價證券資訊" in lines[0]:
-            df = pd.read_csv(io.StringIO("\n".join(lines[1:])))
+            df = pd.read_csv(io.StringIO("\n".join(lines[1:])), dtype=str)
             time_col, reason_col = '處置起迄時間', '處置條件'
         elif "上櫃處置股票資訊" in lines[0] or "期間:" in lines[0]:
-            df = pd.read_csv(io.StringIO("\n".join(lines[2:])))
+            df = pd.read_csv(io.StringIO("\n".join(lines[2:])), dtype=str)
             time_col, reason_col = '處置起訖時間', '處置原因'
         else:
-            df = pd.read_csv(io.StringIO("\n".join(lines)))
+            df = pd.read_csv(io.StringIO("\n".join(lines)), dtype=str)
             time_col = next((c for c in df.columns if '處置起' in c), None)
             reason_col = next((c for c in df.columns if '原因' in c or '條件' in c), None)
 
-        for _, row in df.iterrows():
-            s_dt, r_dt = parse_period(row.get(time_col, ''))
-            code = str(row.get('證券代號', '')).split('.')[0].strip()
-            if not code or not r_dt: continue
-            # 僅保留尚未出關的資料
-            if r_dt > logical_today:
-                results.append({
-                    "股票名稱及代號": f"{str(row.get('證券名稱','未知'))} ({code})",
-                    "代號": code,
-                    "撮合方式": "20" if "20" in str(row.get('處置內容','')) else "5",
-                    "處置起日": s_dt,
-                    "出關時間": r_dt,
-                    "處置原因": str(row.get(reason_col, ''))
-                })
-    except: pass
+        # 整欄向量化解析，取代 iterrows 逐列 row.get 的標量裝箱
+        def get(col):
+            return df[col].fillna('').astype(str) if col in df.columns else pd.Series('', index=df.index)
+
+        codes = get('證券代號').str.split('.').str[0].str.strip()
+        names = df['證券名稱'].fillna('未知').astype(str) if '證券名稱' in df.columns else pd.Series('未知', index=df.index)
+        # 期間欄一次 str.extract 抽出起訖年月日，再整欄組日期；解析失敗的列自然成為 NaT
+        ext = get(time_col).str.replace(' ', '', regex=False).str.extract(_PERIOD_RE)
+        start = pd.to_datetime({'year': ext[0].astype(float) + ROC_OFFSET,
+                                'month': ext[1].astype(float),
+                                'day': ext[2].astype(float)}, errors='coerce')
+        # 出關日 = 迄日 + 1
+        release = pd.to_datetime({'year': ext[3].astype(float) + ROC_OFFSET,
+                                  'month': ext[4].astype(float),
+                                  'day': ext[5].astype(float)}, errors='coerce') + pd.Timedelta(days=1)
+        out = pd.DataFrame({
+            "股票名稱及代號": names + " (" + codes + ")",
+            "代號": codes,
+            "撮合方式": np.where(get('處置內容').str.contains('20', regex=False), "20", "5"),
+            "處置起日": start.dt.strftime("%Y-%m-%d"),
+            "出關時間": release.dt.strftime("%Y-%m-%d"),
+            "處置原因": get(reason_col)
+        })
+        results = out[(codes != '') & release.notna()].to_dict('records')
+    except Exception: pass  # 非官方格式的檔案直接略過
     return results
 
 # --- 4. 主介面 ---
 def main():
     st.title("⚖️ 處置中標的監控")
-    logical_today = get_logical_today()
+    today_str = get_logical_today()
+    today_ts = pd.Timestamp(today_str)
     
     # 儲存在 Session State，避免重新整理網頁時消失
     if 'current_db' not in st.session_state:
@@ -100,28 +104,39 @@ def main():
         uploaded_files = st.file_uploader("多選上傳", type="csv", accept_multiple_files=True, label_visibility="collapsed")
         if uploaded_files:
             if st.button("🚀 執行多檔合併解析", use_container_width=True):
-                all_data_list = []
-                for f in uploaded_files:
+                # 以「代號」為鍵做雜湊合併：後解析的覆蓋先前的，等同 keep='last' 去重
+                merged = {}
+                progress = st.empty()  # 逐檔回報進度，不用等全部解析完才有畫面
+                for i, f in enumerate(uploaded_files, 1):
+                    progress.write(f"⏳ 解析中 ({i}/{len(uploaded_files)})：{f.name}")
                     f.seek(0)
-                    all_data_list.extend(process_official_csv(f))
-                
-                if all_data_list:
-                    full_df = pd.DataFrame(all_data_list)
-                    # 自動去重：以「代號」為主，保留最後一筆
-                    st.session_state.current_db = full_df.drop_duplicates(subset=['代號'], keep='last')
+                    for entry in process_official_csv(f.read()):
+                        # 已出關的歷史列不進 merge，免得覆蓋同代號的現行處置 (官方檔對再處置股兩者都有)
+                        if entry["出關時間"] > today_str:
+                            merged[entry["代號"]] = entry
+                progress.empty()
+
+                if merged:
+                    full_df = pd.DataFrame.from_records(list(merged.values()))
+                    # 日期欄轉 datetime64：比較與排序走整數路徑，只在顯示時格式化
+                    full_df["處置起日"] = pd.to_datetime(full_df["處置起日"])
+                    full_df["出關時間"] = pd.to_datetime(full_df["出關時間"])
+                    # 僅保留尚未出關的資料
+                    full_df = full_df[full_df["出關時間"].values > today_ts]
+                    st.session_state.current_db = full_df
+                    # 結果已存入 Session State，下方表格同一輪直接渲染，不需 st.rerun() 整頁重跑
                     st.success(f"合併完成！共整理出 {len(st.session_state.current_db)} 檔處置標的。")
-                    st.rerun()
 
     db = st.session_state.current_db
     if not db.empty:
         # 顯示資料預處理
         db_disp = db.copy()
         db_disp["🔓 出關日期"] = db_disp["出關時間"].apply(get_simple_date)
-        db_disp["🚨 白話解讀"] = db_disp.apply(translate_to_human, axis=1)
+        db_disp["🚨 白話解讀"] = translate_to_human(db_disp)
         db_sorted = db_disp.sort_values(by="出關時間")
 
         # --- A. 明日進處置 (起日 > 邏輯今天) ---
-        df_new = db_sorted[db_sorted["處置起日"] > logical_today]
+        df_new = db_sorted[db_sorted["處置起日"] > today_ts]
         st.markdown("---")
         l, r = st.columns(2)
         with l:
@@ -134,16 +149,18 @@ def main():
 
         # --- B. 撮合分欄顯示 (所有標的) ---
         st.markdown("---")
+        # 撮合方式在解析時已正規化為 '5'/'20'，一趟等值比較同時供兩欄使用
+        is_20 = db_sorted['撮合方式'].astype(str).eq('20')
         c5, c20 = st.columns(2)
         with c5:
             st.subheader("⏳ 5分鐘撮合")
-            df_5 = db_sorted[db_sorted['撮合方式'].astype(str).str.contains('5')]
+            df_5 = db_sorted[~is_20]
             if not df_5.empty:
                 st.dataframe(df_5[["股票名稱及代號", "🔓 出關日期", "🚨 白話解讀"]], hide_index=True, use_container_width=True)
             else: st.write("無 5 分鐘標的")
         with c20:
             st.subheader("🚨 20分鐘撮合")
-            df_20 = db_sorted[db_sorted['撮合方式'].astype(str).str.contains('20')]
+            df_20 = db_sorted[is_20]
             if not df_20.empty:
                 st.dataframe(df_20[["股票名稱及代號", "🔓 出關日期", "🚨 白話解讀"]], hide_index=True, use_container_width=True)
             else: st.write("無 20 分鐘標的")